@@ -0,0 +1,146 @@
+import hashlib
+import sys
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, WorkoutPlan, ProgressTracking, PlanCohortStats, user_workout_plan
+
+PERCENTILES = (10, 25, 50, 75, 90)
+# Fingerprint of a plan without members
+EMPTY_FINGERPRINT = (hashlib.sha1(b"").hexdigest(), "0")
+
+def plan_progress_arrays(plan):
+    """Return (user_ids, days, weights) for every weigh-in of the plan's
+    members inside the plan window, sorted by user and date. days holds
+    date ordinals."""
+    rows = db.session.query(ProgressTracking.user_id, ProgressTracking.date, ProgressTracking.weight) \
+        .join(user_workout_plan, user_workout_plan.c.user_id == ProgressTracking.user_id) \
+        .filter(user_workout_plan.c.workout_plan_id == plan.id,
+                ProgressTracking.date >= plan.start_date,
+                ProgressTracking.date <= plan.end_date) \
+        .order_by(ProgressTracking.user_id, ProgressTracking.date, ProgressTracking.id) \
+        .all()
+
+    user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter((row[1].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    weights = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return user_ids, days, weights
+
+def cohort_stats(user_ids, days, weights, member_count, window_days):
+    stats = {
+        "member_count": member_count,
+        "tracked_count": 0,
+        "mean_delta": None,
+        "median_delta": None,
+        "percentiles": None,
+        "adherence": 0.0
+    }
+    if not member_count or not len(user_ids):
+        return stats
+
+    # user_ids is sorted, so each user's weigh-ins form one contiguous run.
+    _, first, counts = np.unique(user_ids, return_index=True, return_counts=True)
+    last = first + counts - 1
+
+    # Share of plan days with at least one weigh-in; members who never logged count as zero.
+    new_day = np.ones(len(user_ids), dtype=bool)
+    new_day[1:] = (user_ids[1:] != user_ids[:-1]) | (days[1:] != days[:-1])
+    logged_days = np.add.reduceat(new_day, first)
+    stats["adherence"] = float((logged_days / window_days).sum() / member_count)
+
+    deltas = (weights[last] - weights[first])[counts > 1]
+    stats["tracked_count"] = int(len(deltas))
+    if len(deltas):
+        stats["mean_delta"] = float(deltas.mean())
+        stats["median_delta"] = float(np.median(deltas))
+        stats["percentiles"] = {
+            f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(deltas, PERCENTILES))
+        }
+    return stats
+
+def day_number(column):
+    if db.engine.dialect.name == 'sqlite':
+        return func.julianday(column)
+    return func.extract('epoch', column) / 86400
+
+def plan_fingerprints(plan_id=None):
+    """Return {plan_id: (members_hash, progress_fingerprint)}.
+
+    members_hash covers the exact member set. progress_fingerprint is the
+    count, id sum, weight sum and day sum of the members' progress rows, so
+    added, deleted, re-weighed and re-dated rows all change it.
+    """
+    members = db.session.query(user_workout_plan.c.workout_plan_id, user_workout_plan.c.user_id) \
+        .order_by(user_workout_plan.c.workout_plan_id, user_workout_plan.c.user_id)
+    progress = db.session.query(
+            user_workout_plan.c.workout_plan_id,
+            func.count(ProgressTracking.id),
+            func.sum(ProgressTracking.id),
+            func.sum(ProgressTracking.weight),
+            func.sum(day_number(ProgressTracking.date))
+        ) \
+        .join(ProgressTracking, ProgressTracking.user_id == user_workout_plan.c.user_id) \
+        .group_by(user_workout_plan.c.workout_plan_id)
+    if plan_id is not None:
+        members = members.filter(user_workout_plan.c.workout_plan_id == plan_id)
+        progress = progress.filter(user_workout_plan.c.workout_plan_id == plan_id)
+
+    member_ids = {}
+    for workout_plan_id, user_id in members:
+        member_ids.setdefault(workout_plan_id, []).append(str(user_id))
+    progress_sums = {
+        workout_plan_id: f"{count}:{id_sum}:{round(weight_sum, 6)}:{day_sum}"
+        for workout_plan_id, count, id_sum, weight_sum, day_sum in progress
+    }
+
+    return {
+        workout_plan_id: (
+            hashlib.sha1(",".join(ids).encode()).hexdigest(),
+            progress_sums.get(workout_plan_id, "0")
+        )
+        for workout_plan_id, ids in member_ids.items()
+    }
+
+def refresh_plan_stats(plan, fingerprint=None):
+    if fingerprint is None:
+        fingerprint = plan_fingerprints(plan.id).get(plan.id, EMPTY_FINGERPRINT)
+    members_hash, progress_fingerprint = fingerprint
+    member_count = db.session.query(func.count()).select_from(user_workout_plan) \
+        .filter(user_workout_plan.c.workout_plan_id == plan.id).scalar()
+
+    user_ids, days, weights = plan_progress_arrays(plan)
+    window_days = (plan.end_date - plan.start_date).days + 1
+    cached = PlanCohortStats.query.get(plan.id) or PlanCohortStats(plan_id=plan.id)
+    cached.stats = cohort_stats(user_ids, days, weights, member_count, window_days)
+    cached.members_hash = members_hash
+    cached.progress_fingerprint = progress_fingerprint
+    cached.computed_at = datetime.utcnow()
+    db.session.add(cached)
+    return cached
+
+def refresh_cohort_stats(full=False):
+    """Recompute cached cohort stats for plans whose member set or member
+    progress changed since the last run (see plan_fingerprints)."""
+    fingerprints = plan_fingerprints()
+    cached = {stats.plan_id: stats for stats in PlanCohortStats.query.all()}
+
+    refreshed = 0
+    for plan in WorkoutPlan.query.all():
+        fingerprint = fingerprints.get(plan.id, EMPTY_FINGERPRINT)
+        current = cached.get(plan.id)
+        if not full and current and (current.members_hash, current.progress_fingerprint) == fingerprint:
+            continue
+        refresh_plan_stats(plan, fingerprint)
+        refreshed += 1
+
+    db.session.commit()
+    return refreshed
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        count = refresh_cohort_stats(full='--full' in sys.argv)
+        print(f"Refreshed cohort stats for {count} workout plan(s)")
@@ -8,7 +8,8 @@ from dotenv import load_dotenv
 import os
 from cryptography.fernet import Fernet
 
-from models import db, User, WorkoutPlan, NutritionPlan, ProgressTracking
+from models import db, User, WorkoutPlan, NutritionPlan, ProgressTracking, PlanCohortStats
+from analytics import refresh_plan_stats
 
 load_dotenv()
 
@@ -135,6 +136,7 @@ class WorkoutPlanResource(Resource):
         if 'end_date' in data:
             plan.end_date = data['end_date']
 
+        PlanCohortStats.query.filter_by(plan_id=plan_id).delete()
         db.session.commit()
         return {"message": "Plan updated"}, 200
 
@@ -143,15 +145,32 @@ class WorkoutPlanResource(Resource):
         if not plan:
             return {"error": "Plan not found"}, 404
 
+        PlanCohortStats.query.filter_by(plan_id=plan_id).delete()
         db.session.delete(plan)
         db.session.commit()
         return {"message": "Plan deleted"}, 200
+
+class PlanCohortResource(Resource):
+    def get(self, plan_id=None):
+        if plan_id:
+            plan = WorkoutPlan.query.get(plan_id)
+            if not plan:
+                return {"error": "Plan not found"}, 404
+
+            stats = PlanCohortStats.query.get(plan_id)
+            if not stats:
+                stats = refresh_plan_stats(plan)
+                db.session.commit()
+            return stats.to_dict(), 200
+
+        return [stats.to_dict() for stats in PlanCohortStats.query.all()], 200
     
 api.add_resource(Register, '/register')
 api.add_resource(Login, '/login')
 api.add_resource(Logout, '/logout')
 api.add_resource(UserResource, '/users', '/users/<int:user_id>')
 api.add_resource(WorkoutPlanResource, '/workout_plans', '/workout_plans/<int:plan_id>')
+api.add_resource(PlanCohortResource, '/analytics/workout_plans', '/analytics/workout_plans/<int:plan_id>')
 
 
 if __name__ == '__main__':
@@ -3,16 +3,32 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_restful import Api, Resource
 from flask_cors import CORS
+from sqlalchemy import tuple_
 import os
+import re
+import math
+import queue
+import datetime
 from cryptography.fernet import Fernet
 
+from sharding import ShardedSession, ShardRouter, merge_sorted
+from write_behind import WriteBehindQueue, ACK_ON_ENQUEUE
+
 # Initialize the app and configure the database
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Serialise the date columns returned by to_dict() as ISO strings
+app.config['RESTFUL_JSON'] = {'default': str}
+
+# Optional sharding of user-owned rows, e.g.
+# SHARD_DATABASE_URIS=sqlite:///shard0.db,sqlite:///shard1.db
+shard_uris = [uri.strip() for uri in os.getenv('SHARD_DATABASE_URIS', '').split(',') if uri.strip()]
+if shard_uris:
+    app.config['SQLALCHEMY_BINDS'] = {f'shard{i}': uri for i, uri in enumerate(shard_uris)}
 
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': ShardedSession})
 migrate = Migrate(app, db)
 api = Api(app)
 CORS(app)
@@ -55,22 +71,208 @@ class ProgressTracking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     weight = db.Column(db.Float, nullable=False)
-    measurements = db.Column(db.String, nullable=True)
     date = db.Column(db.Date, nullable=False)
 
+    metrics = db.relationship('ProgressMeasurement', backref='progress', lazy='selectin', cascade='all, delete-orphan')
+
     def to_dict(self):
         return {
             "id": self.id,
             "user_id": self.user_id,
             "weight": self.weight,
-            "measurements": decrypt(self.measurements) if self.measurements else None,
+            "measurements": {m.metric: {"value": float(decrypt(m.value)), "unit": m.unit} for m in self.metrics},
+            "date": self.date,
+        }
+
+# One row per metric of a progress entry, so a single metric can be charted
+# without decrypting the rest of the entry. value holds the encrypted number.
+class ProgressMeasurement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    progress_id = db.Column(db.Integer, db.ForeignKey('progress_tracking.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    metric = db.Column(db.String, nullable=False)
+    value = db.Column(db.String, nullable=False)
+    unit = db.Column(db.String, nullable=True)
+    date = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_progress_measurement_user_metric_date', 'user_id', 'metric', 'date'),
+    )
+
+    def to_dict(self):
+        return {
+            "value": float(decrypt(self.value)),
+            "unit": self.unit,
             "date": self.date,
         }
 
+MEASUREMENT_PATTERN = re.compile(r'([A-Za-z][A-Za-z ]*?)\s*:\s*(-?\d+(?:\.\d+)?)\s*([A-Za-z%]*)')
+
+def measurement_value(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Measurement '{name}' must be a number")
+    try:
+        value = float(value)
+    except (OverflowError, ValueError):
+        raise ValueError(f"Measurement '{name}' must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"Measurement '{name}' must be a finite number")
+    return value
+
+def parse_measurements(data):
+    """Turn request measurements into (metric, value, unit) tuples.
+
+    Accepts {"waist": 80}, {"waist": {"value": 80, "unit": "cm"}} or the
+    legacy "Chest: 90 cm, Waist: 80 cm" text, where every comma-separated
+    part has to be a full "Name: number unit" entry.
+    """
+    parsed = []
+    if isinstance(data, str):
+        for part in data.split(','):
+            if not part.strip():
+                continue
+            match = MEASUREMENT_PATTERN.fullmatch(part.strip())
+            if not match:
+                raise ValueError(f"Could not read measurement '{part.strip()}', expected e.g. 'Waist: 80 cm'")
+            name, value, unit = match.groups()
+            parsed.append((name.strip().lower(), measurement_value(name, value), unit or None))
+    elif isinstance(data, dict):
+        for name, entry in data.items():
+            if not name.strip():
+                raise ValueError("Measurement names must not be empty")
+            unit = None
+            if isinstance(entry, dict):
+                unit = entry.get('unit')
+                entry = entry.get('value')
+            if unit is not None and not isinstance(unit, str):
+                raise ValueError(f"Unit of measurement '{name}' must be a string")
+            if isinstance(entry, str):
+                raise ValueError(f"Measurement '{name}' must be a number")
+            parsed.append((name.strip().lower(), measurement_value(name, entry), unit or None))
+    else:
+        raise ValueError("Measurements must be an object or a string")
+
+    seen = set()
+    for metric, _, _ in parsed:
+        if metric in seen:
+            raise ValueError(f"Measurement '{metric}' is given more than once")
+        seen.add(metric)
+    return parsed
+
+def set_measurements(progress, data):
+    progress.metrics = [
+        ProgressMeasurement(user_id=progress.user_id, metric=metric, value=encrypt(repr(value)), unit=unit, date=progress.date)
+        for metric, value, unit in parse_measurements(data)
+    ]
+
+def progress_weight(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("weight must be a number")
+    try:
+        value = float(value)
+    except OverflowError:
+        raise ValueError("weight must be a number")
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("weight must be a positive number")
+    return value
+
+def progress_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("date must be an ISO date such as 2024-01-31")
+
+shard_router = None
+if shard_uris:
+    shard_router = ShardRouter(app, db, app.config['SQLALCHEMY_BINDS'], [NutritionPlan, ProgressTracking, ProgressMeasurement])
+
+@app.cli.command('create-shards')
+def create_shards():
+    """Create the user-owned tables in every shard database."""
+    if shard_router:
+        shard_router.create_all()
+
+def route_to_user(user_id):
+    """Select the shard of user_id. Returns an error response for an id
+    that cannot own rows, before anything is written or queued."""
+    if isinstance(user_id, bool) or not isinstance(user_id, int):
+        return {"error": "user_id must be an integer"}, 400
+    if shard_router:
+        shard_router.use_shard(user_id)
+    return None
+
+def route_request_user():
+    """Select the shard of the ?user_id= owning the requested row. Returns an
+    error response when sharding is enabled and no user_id was given."""
+    if not shard_router:
+        return None
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None:
+        return {"error": "user_id is required when sharding is enabled"}, 400
+    shard_router.use_shard(user_id)
+    return None
+
+def find_owned(model, record_id):
+    # Ids are only unique within a shard, so a given ?user_id= also scopes the lookup.
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None:
+        return model.query.get(record_id)
+    return model.query.filter_by(id=record_id, user_id=user_id).first()
+
+def keyset_page(model, after, limit):
+    query = model.query.order_by(model.user_id, model.id)
+    if after:
+        query = query.filter(tuple_(model.user_id, model.id) > tuple_(*after))
+    if limit is not None:
+        query = query.limit(limit)
+    return [row.to_dict() for row in query]
+
+def list_rows(model):
+    """List rows ordered by (user_id, id). Pass the last row's user_id and id
+    as ?after_user_id=&after_id= with ?limit= to page; with sharding every
+    shard is queried in parallel and the pages are merged."""
+    cursor = [request.args.get(name) for name in ('after_user_id', 'after_id')]
+    after = None
+    if any(value is not None for value in cursor):
+        try:
+            after = tuple(int(value) for value in cursor)
+        except (TypeError, ValueError):
+            return {"error": "after_user_id and after_id must be given together as integers"}, 400
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return {"error": "limit must be an integer"}, 400
+    if limit is not None and limit < 0:
+        return {"error": "limit must not be negative"}, 400
+
+    if not shard_router:
+        return keyset_page(model, after, limit), 200
+    pages = shard_router.scatter(lambda: keyset_page(model, after, limit))
+    return merge_sorted(pages, key=lambda row: (row['user_id'], row['id']), limit=limit), 200
+
+# Optional write-behind mode for progress writes: 'enqueue' acknowledges once
+# the row is queued, 'flush' once its batch is committed. Unset writes inline.
+progress_write_mode = os.getenv('PROGRESS_WRITE_BEHIND')
+progress_writer = None
+if progress_write_mode:
+    progress_writer = WriteBehindQueue(
+        app, db,
+        max_size=int(os.getenv('PROGRESS_WRITE_QUEUE_SIZE', 1000)),
+        batch_size=int(os.getenv('PROGRESS_WRITE_BATCH_SIZE', 100)),
+        flush_interval_ms=int(os.getenv('PROGRESS_WRITE_FLUSH_MS', 50)),
+        durability=progress_write_mode,
+        engine_for=shard_router.engine_for if shard_router else None,
+        ack_timeout_ms=int(os.getenv('PROGRESS_WRITE_ACK_TIMEOUT_MS', 5000)),
+        serialize=lambda progress: progress.to_dict()
+    )
+
 # Nutrition Plan Resources
 class NutritionPlanResource(Resource):
     def post(self):
         data = request.get_json()
+        error = route_to_user(data.get('user_id'))
+        if error:
+            return error
         new_plan = NutritionPlan(
             user_id=data['user_id'],
             title=encrypt(data['title']),
@@ -84,16 +286,21 @@ class NutritionPlanResource(Resource):
 
     def get(self, plan_id=None):
         if plan_id:
-            plan = NutritionPlan.query.get(plan_id)
+            error = route_request_user()
+            if error:
+                return error
+            plan = find_owned(NutritionPlan, plan_id)
             if plan:
                 return plan.to_dict(), 200
             return {"error": "Plan not found"}, 404
         
-        plans = NutritionPlan.query.all()
-        return [plan.to_dict() for plan in plans], 200
+        return list_rows(NutritionPlan)
 
     def patch(self, plan_id):
-        plan = NutritionPlan.query.get(plan_id)
+        error = route_request_user()
+        if error:
+            return error
+        plan = find_owned(NutritionPlan, plan_id)
         if not plan:
             return {"error": "Plan not found"}, 404
         
@@ -111,7 +318,10 @@ class NutritionPlanResource(Resource):
         return {"message": "Plan updated"}, 200
 
     def delete(self, plan_id):
-        plan = NutritionPlan.query.get(plan_id)
+        error = route_request_user()
+        if error:
+            return error
+        plan = find_owned(NutritionPlan, plan_id)
         if not plan:
             return {"error": "Plan not found"}, 404
 
@@ -123,44 +333,81 @@ class NutritionPlanResource(Resource):
 class ProgressTrackingResource(Resource):
     def post(self):
         data = request.get_json()
-        new_progress = ProgressTracking(
-            user_id=data['user_id'],
-            weight=data['weight'],
-            measurements=encrypt(data['measurements']) if data.get('measurements') else None,
-            date=data['date']
-        )
+        error = route_to_user(data.get('user_id'))
+        if error:
+            return error
+        # Check every field here: in enqueue mode the row is acknowledged
+        # before it is written, so it must not be able to fail later.
+        try:
+            new_progress = ProgressTracking(
+                user_id=data['user_id'],
+                weight=progress_weight(data.get('weight')),
+                date=progress_date(data.get('date'))
+            )
+            if data.get('measurements'):
+                set_measurements(new_progress, data['measurements'])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        if progress_writer:
+            try:
+                pending = progress_writer.submit(new_progress)
+            except queue.Full:
+                return {"error": "Too many pending progress writes, try again later"}, 503
+            except TimeoutError:
+                return {"error": "Progress write was not confirmed in time"}, 504
+            except Exception:
+                app.logger.exception("Queued progress write failed")
+                return {"error": "Could not save progress"}, 500
+            if progress_writer.durability == ACK_ON_ENQUEUE:
+                return {"message": "Progress accepted"}, 202
+            return pending.result or {"message": "Progress saved"}, 201
+
         db.session.add(new_progress)
         db.session.commit()
         return new_progress.to_dict(), 201
 
     def get(self, progress_id=None):
         if progress_id:
-            progress = ProgressTracking.query.get(progress_id)
+            error = route_request_user()
+            if error:
+                return error
+            progress = find_owned(ProgressTracking, progress_id)
             if progress:
                 return progress.to_dict(), 200
             return {"error": "Progress not found"}, 404
         
-        progresses = ProgressTracking.query.all()
-        return [progress.to_dict() for progress in progresses], 200
+        return list_rows(ProgressTracking)
 
     def patch(self, progress_id):
-        progress = ProgressTracking.query.get(progress_id)
+        error = route_request_user()
+        if error:
+            return error
+        progress = find_owned(ProgressTracking, progress_id)
         if not progress:
             return {"error": "Progress not found"}, 404
         
         data = request.get_json()
-        if 'weight' in data:
-            progress.weight = data['weight']
-        if 'measurements' in data:
-            progress.measurements = encrypt(data['measurements'])
-        if 'date' in data:
-            progress.date = data['date']
+        try:
+            if 'weight' in data:
+                progress.weight = progress_weight(data['weight'])
+            if 'date' in data:
+                progress.date = progress_date(data['date'])
+                for m in progress.metrics:
+                    m.date = progress.date
+            if 'measurements' in data:
+                set_measurements(progress, data['measurements'] or {})
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
         db.session.commit()
         return {"message": "Progress updated"}, 200
 
     def delete(self, progress_id):
-        progress = ProgressTracking.query.get(progress_id)
+        error = route_request_user()
+        if error:
+            return error
+        progress = find_owned(ProgressTracking, progress_id)
         if not progress:
             return {"error": "Progress not found"}, 404
 
@@ -168,9 +415,26 @@ class ProgressTrackingResource(Resource):
         db.session.commit()
         return {"message": "Progress deleted"}, 200
 
+class ProgressMetricResource(Resource):
+    def get(self, user_id, metric):
+        error = route_to_user(user_id)
+        if error:
+            return error
+        points = ProgressMeasurement.query.filter_by(user_id=user_id, metric=metric.lower()) \
+            .order_by(ProgressMeasurement.date).all()
+        return [point.to_dict() for point in points], 200
+
+class ProgressWriteMetricsResource(Resource):
+    def get(self):
+        if not progress_writer:
+            return {"error": "Write-behind mode is disabled"}, 404
+        return progress_writer.metrics(), 200
+
 # Add routes
 api.add_resource(NutritionPlanResource, '/nutrition_plans', '/nutrition_plans/<int:plan_id>')
 api.add_resource(ProgressTrackingResource, '/progress_tracking', '/progress_tracking/<int:progress_id>')
+api.add_resource(ProgressMetricResource, '/users/<int:user_id>/progress/<string:metric>')
+api.add_resource(ProgressWriteMetricsResource, '/metrics/progress_writes')
 
 # Basic endpoint to check if the server is running
 @app.route('/')
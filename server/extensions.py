@@ -0,0 +1,4 @@
+from flask_sqlalchemy import SQLAlchemy
+
+# Shared by app.py and models.py so neither has to import the other
+db = SQLAlchemy()
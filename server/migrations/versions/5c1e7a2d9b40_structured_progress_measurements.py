@@ -0,0 +1,142 @@
+"""structured progress measurements
+
+Revision ID: 5c1e7a2d9b40
+Revises: 0b3dee0f1802
+Create Date: 2026-10-19 09:12:44.318205
+
+"""
+import math
+import os
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from cryptography.fernet import Fernet, InvalidToken
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a2d9b40'
+down_revision = '0b3dee0f1802'
+branch_labels = None
+depends_on = None
+
+MEASUREMENT_PATTERN = re.compile(r'([A-Za-z][A-Za-z ]*?)\s*:\s*(-?\d+(?:\.\d+)?)\s*([A-Za-z%]*)')
+
+
+def _plain_text(value, cipher):
+    # Rows written through the API are encrypted, seeded rows are not.
+    # Returns None for an encrypted row that cannot be decrypted.
+    if cipher is not None:
+        try:
+            return cipher.decrypt(value.encode()).decode()
+        except InvalidToken:
+            pass
+    if value.startswith('gAAAAA'):
+        return None
+    return value
+
+
+def _parse(text):
+    """Return [(metric, value, unit)] or None unless every comma-separated
+    part is a full 'Name: number unit' entry and no metric repeats."""
+    parsed = []
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        match = MEASUREMENT_PATTERN.fullmatch(part.strip())
+        if not match:
+            return None
+        name, value, unit = match.groups()
+        value = float(value)
+        if not math.isfinite(value):
+            return None
+        parsed.append((name.strip().lower(), value, unit or None))
+    names = [name for name, _, _ in parsed]
+    if len(set(names)) != len(names):
+        return None
+    return parsed
+
+
+def upgrade():
+    encryption_key = os.getenv('ENCRYPTION_KEY')
+    cipher = Fernet(encryption_key.encode()) if encryption_key else None
+
+    bind = op.get_bind()
+    progress_tracking = sa.table('progress_tracking',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('measurements', sa.Text),
+        sa.column('date', sa.Date)
+    )
+    progress_measurement = sa.table('progress_measurement',
+        sa.column('progress_id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('metric', sa.String),
+        sa.column('value', sa.String),
+        sa.column('unit', sa.String),
+        sa.column('date', sa.Date)
+    )
+
+    rows = []
+    undecryptable = []
+    unparsed = []
+    for progress in bind.execute(sa.select(progress_tracking).where(progress_tracking.c.measurements.isnot(None))):
+        text = _plain_text(progress.measurements, cipher)
+        if text is None:
+            undecryptable.append(progress.id)
+            continue
+        parsed = _parse(text)
+        if parsed is None:
+            unparsed.append(progress.id)
+            continue
+        for metric, value, unit in parsed:
+            rows.append({
+                "progress_id": progress.id,
+                "user_id": progress.user_id,
+                "metric": metric,
+                "value": value,
+                "unit": unit,
+                "date": progress.date
+            })
+
+    # A follow-up migration drops the text column, so refuse to continue
+    # rather than lose measurements that could not be converted. This runs
+    # before any DDL because SQLite cannot roll a created table back.
+    if undecryptable:
+        raise RuntimeError(
+            f"Could not decrypt measurements of {len(undecryptable)} progress_tracking rows "
+            f"(ids {undecryptable}); set ENCRYPTION_KEY to the key they were written with"
+        )
+    if unparsed:
+        raise RuntimeError(
+            f"Could not parse measurements of {len(unparsed)} progress_tracking rows "
+            f"(ids {unparsed}); fix them to the 'Waist: 80 cm' form, one entry per metric, and re-run"
+        )
+    if rows and cipher is None:
+        raise RuntimeError("ENCRYPTION_KEY is required to encrypt the migrated measurement values")
+
+    # Values are stored encrypted per row, so one metric can be read without the others.
+    for row in rows:
+        row["value"] = cipher.encrypt(repr(row["value"]).encode()).decode()
+
+    op.create_table('progress_measurement',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('progress_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(), nullable=False),
+    sa.Column('value', sa.String(), nullable=False),
+    sa.Column('unit', sa.String(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['progress_id'], ['progress_tracking.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_progress_measurement_user_metric_date', 'progress_measurement', ['user_id', 'metric', 'date'], unique=False)
+
+    if rows:
+        op.bulk_insert(progress_measurement, rows)
+
+
+def downgrade():
+    op.drop_index('ix_progress_measurement_user_metric_date', table_name='progress_measurement')
+    op.drop_table('progress_measurement')
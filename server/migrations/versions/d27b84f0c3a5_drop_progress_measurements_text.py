@@ -0,0 +1,63 @@
+"""drop progress measurements text
+
+Revision ID: d27b84f0c3a5
+Revises: 9a4f3c61e8d2
+Create Date: 2026-10-19 16:41:09.773120
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from cryptography.fernet import Fernet
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27b84f0c3a5'
+down_revision = '9a4f3c61e8d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The values now live in progress_measurement (see 5c1e7a2d9b40).
+    with op.batch_alter_table('progress_tracking') as batch_op:
+        batch_op.drop_column('measurements')
+
+
+def downgrade():
+    with op.batch_alter_table('progress_tracking') as batch_op:
+        batch_op.add_column(sa.Column('measurements', sa.Text(), nullable=True))
+
+    # Rebuild the "Chest: 90 cm, Waist: 80 cm" text, encrypted like the API used to store it.
+    encryption_key = os.getenv('ENCRYPTION_KEY')
+    if not encryption_key:
+        raise RuntimeError("ENCRYPTION_KEY is required to decrypt the measurement values")
+    cipher = Fernet(encryption_key.encode())
+
+    bind = op.get_bind()
+    progress_measurement = sa.table('progress_measurement',
+        sa.column('progress_id', sa.Integer),
+        sa.column('metric', sa.String),
+        sa.column('value', sa.String),
+        sa.column('unit', sa.String)
+    )
+    progress_tracking = sa.table('progress_tracking',
+        sa.column('id', sa.Integer),
+        sa.column('measurements', sa.Text)
+    )
+
+    texts = {}
+    query = sa.select(progress_measurement).order_by(progress_measurement.c.progress_id, progress_measurement.c.metric)
+    for m in bind.execute(query):
+        value = float(cipher.decrypt(m.value.encode()).decode())
+        part = f"{m.metric.title()}: {value:g}" + (f" {m.unit}" if m.unit else "")
+        texts.setdefault(m.progress_id, []).append(part)
+
+    for progress_id, parts in texts.items():
+        text = cipher.encrypt(", ".join(parts).encode()).decode()
+        bind.execute(
+            progress_tracking.update()
+            .where(progress_tracking.c.id == progress_id)
+            .values(measurements=text)
+        )
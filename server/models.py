@@ -1,5 +1,5 @@
 from datetime import date
-from app import db
+from extensions import db
 from sqlalchemy.orm import validates
 
 user_workout_plan = db.Table('user_workout_plan',
@@ -88,14 +88,50 @@ class ProgressTracking(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     weight = db.Column(db.Float, nullable=False)
-    measurements = db.Column(db.Text, nullable=True)
     date = db.Column(db.Date, nullable=False, default=date.today)
 
+    metrics = db.relationship('ProgressMeasurement', backref='progress', lazy='selectin', cascade='all, delete-orphan')
+
     def to_dict(self):
         return {
             "id": self.id,
             "user_id": self.user_id,
             "weight": self.weight,
-            "measurements": self.measurements,
+            "measurements": {m.metric: {"value": m.value, "unit": m.unit} for m in self.metrics},
+            "date": self.date
+        }
+
+class ProgressMeasurement(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    progress_id = db.Column(db.Integer, db.ForeignKey('progress_tracking.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    metric = db.Column(db.String, nullable=False)
+    # Fernet-encrypted number, like the other encrypted fields
+    value = db.Column(db.String, nullable=False)
+    unit = db.Column(db.String, nullable=True)
+    date = db.Column(db.Date, nullable=False, default=date.today)
+
+    __table_args__ = (
+        db.Index('ix_progress_measurement_user_metric_date', 'user_id', 'metric', 'date'),
+    )
+
+    def to_dict(self):
+        return {
+            "value": self.value,
+            "unit": self.unit,
             "date": self.date
         }
+
+class PlanCohortStats(db.Model):
+    plan_id = db.Column(db.Integer, db.ForeignKey('workout_plan.id'), primary_key=True)
+    stats = db.Column(db.JSON, nullable=False)
+    members_hash = db.Column(db.String, nullable=False)
+    progress_fingerprint = db.Column(db.String, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            "plan_id": self.plan_id,
+            "stats": self.stats,
+            "computed_at": self.computed_at.isoformat()
+        }
@@ -2,8 +2,8 @@
 from datetime import date, timedelta
 
 from werkzeug.security import generate_password_hash
-from app import app, db
-from models import User, WorkoutPlan, NutritionPlan, ProgressTracking
+from app import app, db, encrypt
+from models import User, WorkoutPlan, NutritionPlan, ProgressTracking, ProgressMeasurement
 
 def seed():
     with app.app_context():
@@ -77,14 +77,20 @@ def seed():
             progress_tracking1 = ProgressTracking(
                 user=user1,
                 weight=75.5,
-                measurements='Chest: 90 cm, Waist: 80 cm',
-                date=date.today()
+                date=date.today(),
+                metrics=[
+                    ProgressMeasurement(user_id=user1.id, metric='chest', value=encrypt('90.0'), unit='cm', date=date.today()),
+                    ProgressMeasurement(user_id=user1.id, metric='waist', value=encrypt('80.0'), unit='cm', date=date.today())
+                ]
             )
             progress_tracking2 = ProgressTracking(
                 user=user2,
                 weight=68.0,
-                measurements='Chest: 85 cm, Waist: 70 cm',
-                date=date.today()
+                date=date.today(),
+                metrics=[
+                    ProgressMeasurement(user_id=user2.id, metric='chest', value=encrypt('85.0'), unit='cm', date=date.today()),
+                    ProgressMeasurement(user_id=user2.id, metric='waist', value=encrypt('70.0'), unit='cm', date=date.today())
+                ]
             )
 
             db.session.add(progress_tracking1)
@@ -0,0 +1,65 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+
+class ShardedSession(Session):
+    """Session that sends queries on sharded models to the engine of the
+    shard picked with ShardRouter.use_shard(); everything else uses the
+    regular Flask-SQLAlchemy bind lookup."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        router = current_app.extensions.get('shard_router')
+        if bind is None and mapper is not None and router and router.is_sharded(mapper):
+            shard = self.info.get('shard')
+            if shard is None:
+                raise RuntimeError("No shard selected for a query on a sharded model")
+            return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class ShardRouter:
+    """Routes the rows of user-owned models to one of several database binds
+    by user_id % number of shards. Adding a shard changes the mapping, so
+    existing rows have to be moved by hand."""
+
+    def __init__(self, app, db, bind_keys, models):
+        self.app = app
+        self.db = db
+        self.bind_keys = list(bind_keys)
+        self.models = set(models)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.bind_keys), thread_name_prefix='shard')
+        app.extensions['shard_router'] = self
+
+    def shard_for(self, user_id):
+        return self.bind_keys[int(user_id) % len(self.bind_keys)]
+
+    def is_sharded(self, mapper):
+        return inspect(mapper).class_ in self.models
+
+    def use_shard(self, user_id):
+        self.db.session.info['shard'] = self.shard_for(user_id)
+
+    def engine_for(self, obj):
+        return self.db.engines[self.shard_for(obj.user_id)]
+
+    def create_all(self):
+        tables = [model.__table__ for model in self.models]
+        for key in self.bind_keys:
+            self.db.metadata.create_all(self.db.engines[key], tables=tables)
+
+    def scatter(self, fn):
+        """Run fn() once per shard in parallel, each call in its own app
+        context with that shard selected, and return the results in shard order."""
+        def run(key):
+            with self.app.app_context():
+                self.db.session.info['shard'] = key
+                return fn()
+        return list(self.executor.map(run, self.bind_keys))
+
+def merge_sorted(results, key, limit=None):
+    """Merge per-shard lists that are already sorted by key."""
+    merged = heapq.merge(*results, key=key)
+    return list(merged) if limit is None else list(islice(merged, limit))
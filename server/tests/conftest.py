@@ -0,0 +1,28 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings read by app2 at import time
+APP2_ENV = ('DATABASE_URI', 'ENCRYPTION_KEY', 'SHARD_DATABASE_URIS', 'PROGRESS_WRITE_BEHIND',
+            'PROGRESS_WRITE_QUEUE_SIZE', 'PROGRESS_WRITE_BATCH_SIZE', 'PROGRESS_WRITE_FLUSH_MS',
+            'PROGRESS_WRITE_ACK_TIMEOUT_MS')
+
+def load_app2(**env):
+    """Import a fresh app2 configured from env; settings not given are unset."""
+    for key in APP2_ENV:
+        os.environ.pop(key, None)
+    os.environ.update(env)
+    sys.modules.pop('app2', None)
+    return importlib.import_module('app2')
+
+@pytest.fixture(autouse=True, scope='module')
+def restore_environ():
+    saved = dict(os.environ)
+    yield
+    os.environ.clear()
+    os.environ.update(saved)
+    sys.modules.pop('app2', None)
@@ -0,0 +1,111 @@
+import datetime
+import importlib
+import os
+import subprocess
+import sys
+
+import pytest
+from cryptography.fernet import Fernet
+
+SERVER = os.path.join(os.path.dirname(__file__), '..')
+
+def day(n):
+    return datetime.date(2024, 1, n)
+
+@pytest.fixture(scope='module')
+def analytics():
+    os.environ['DATABASE_URI'] = 'sqlite://'
+    os.environ['ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+    importlib.import_module('app')
+    return importlib.import_module('analytics')
+
+@pytest.fixture
+def cohort(analytics):
+    """A 10-day plan with members u0 and u2; u1 is not a member yet."""
+    from app import app
+    from models import db, User, WorkoutPlan, ProgressTracking
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        plan = WorkoutPlan(title='t', duration=99, start_date=day(1), end_date=day(10))
+        users = [User(username='u', email=f'u{i}@example.com', password='p', age=30) for i in range(3)]
+        db.session.add_all([plan, *users])
+        db.session.commit()
+
+        # u1's rows get the lowest ids
+        for n, weight in [(1, 60), (8, 58)]:
+            db.session.add(ProgressTracking(user_id=users[1].id, weight=weight, date=day(n)))
+        for n, weight in [(1, 80), (9, 77)]:
+            db.session.add(ProgressTracking(user_id=users[0].id, weight=weight, date=day(n)))
+        # Ten weigh-ins on one day count as one day of adherence
+        for _ in range(10):
+            db.session.add(ProgressTracking(user_id=users[2].id, weight=50, date=day(2)))
+        users[0].workout_plans.append(plan)
+        users[2].workout_plans.append(plan)
+        db.session.commit()
+
+        yield db, plan, users, analytics.refresh_cohort_stats
+
+def test_cohort_stats(cohort):
+    db, plan, _, refresh = cohort
+    from models import PlanCohortStats
+
+    assert refresh() == 1
+    stats = db.session.get(PlanCohortStats, plan.id).stats
+    assert stats["member_count"] == 2
+    assert stats["tracked_count"] == 2
+    assert stats["mean_delta"] == pytest.approx(-1.5)
+    assert stats["median_delta"] == pytest.approx(-1.5)
+    # u0 logged 2 of 10 days, u2 logged 1 of 10 days
+    assert stats["adherence"] == pytest.approx(0.15)
+    assert refresh() == 0
+
+def test_refresh_detects_member_swap(cohort):
+    db, plan, users, refresh = cohort
+    refresh()
+    users[0].workout_plans.remove(plan)
+    users[1].workout_plans.append(plan)
+    db.session.commit()
+    assert refresh() == 1
+
+def test_refresh_detects_deleted_older_row(cohort):
+    db, _, users, refresh = cohort
+    from models import ProgressTracking
+
+    refresh()
+    db.session.delete(ProgressTracking.query.filter_by(user_id=users[0].id).order_by(ProgressTracking.id).first())
+    db.session.commit()
+    assert refresh() == 1
+
+def test_refresh_detects_date_moved_out_of_window(cohort):
+    db, plan, users, refresh = cohort
+    from models import PlanCohortStats, ProgressTracking
+
+    refresh()
+    row = ProgressTracking.query.filter_by(user_id=users[0].id, date=day(9)).one()
+    row.date = day(20)
+    db.session.commit()
+    assert refresh() == 1
+    assert db.session.get(PlanCohortStats, plan.id).stats["tracked_count"] == 1
+
+def test_batch_job_runs(tmp_path):
+    db_uri = f'sqlite:///{tmp_path / "app.db"}'
+    env = dict(os.environ, DATABASE_URI=db_uri, ENCRYPTION_KEY=Fernet.generate_key().decode())
+    create = "from app import app, db\nwith app.app_context(): db.create_all()"
+    subprocess.run([sys.executable, '-c', create], cwd=SERVER, env=env, check=True)
+
+    result = subprocess.run([sys.executable, 'analytics.py', '--full'], cwd=SERVER, env=env,
+                            capture_output=True, text=True, check=True)
+    assert "Refreshed cohort stats for 0 workout plan(s)" in result.stdout
+
+def test_endpoint_computes_missing_stats_once(cohort):
+    _, plan, _, refresh = cohort
+    from app import app
+
+    client = app.test_client()
+    response = client.get(f'/analytics/workout_plans/{plan.id}')
+    assert response.status_code == 200
+    assert response.json["stats"]["member_count"] == 2
+    assert [row["plan_id"] for row in client.get('/analytics/workout_plans').json] == [plan.id]
+    assert refresh() == 0
@@ -0,0 +1,131 @@
+import datetime
+import importlib.util
+import os
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from cryptography.fernet import Fernet
+
+from conftest import load_app2
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'versions',
+                         '5c1e7a2d9b40_structured_progress_measurements.py')
+
+@pytest.fixture(scope='module')
+def app2(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp('measurements') / 'app.db'
+    app2 = load_app2(DATABASE_URI=f'sqlite:///{db_path}', ENCRYPTION_KEY=Fernet.generate_key().decode())
+    with app2.app.app_context():
+        app2.db.create_all()
+    app2.db_path = db_path
+    return app2
+
+@pytest.mark.parametrize('data, expected', [
+    ({"Waist": 80}, [("waist", 80.0, None)]),
+    ({"hip": {"value": 95.5, "unit": "cm"}}, [("hip", 95.5, "cm")]),
+    ("Chest: 90 cm, Waist: 80 cm", [("chest", 90.0, "cm"), ("waist", 80.0, "cm")]),
+    ("Waist: 80 cm,", [("waist", 80.0, "cm")]),
+])
+def test_parse_measurements(app2, data, expected):
+    assert app2.parse_measurements(data) == expected
+
+@pytest.mark.parametrize('data', [
+    "garbage",
+    "Waist: 80 cm; arm 30",
+    "Waist: 80,5 cm",
+    "Height: 5'10\"",
+    "Waist: " + "9" * 400,
+    {"Waist": 80, "waist": 81},
+    {" ": 80},
+    {"waist": {"value": 80, "unit": 5}},
+    {"waist": {"value": 80, "unit": {"a": 1}}},
+    {"waist": float('nan')},
+    {"waist": float('inf')},
+    {"waist": 10 ** 400},
+    {"waist": "80"},
+    {"waist": True},
+    ["waist", 80],
+])
+def test_parse_measurements_rejects(app2, data):
+    with pytest.raises(ValueError):
+        app2.parse_measurements(data)
+
+def test_values_are_stored_encrypted(app2):
+    with app2.app.app_context():
+        progress = app2.ProgressTracking(user_id=7, weight=70, date=datetime.date(2024, 1, 1))
+        app2.set_measurements(progress, {"waist": 80.5, "chest": 90})
+        app2.db.session.add(progress)
+        app2.db.session.commit()
+        progress_id = progress.id
+
+    stored = sqlite3.connect(app2.db_path).execute(
+        'SELECT value FROM progress_measurement WHERE progress_id = ?', (progress_id,)
+    ).fetchall()
+    assert len(stored) == 2
+    assert all('80.5' not in value and '90' not in value for value, in stored)
+
+    client = app2.app.test_client()
+    assert client.get('/users/7/progress/waist').json == [{"value": 80.5, "unit": None, "date": "2024-01-01"}]
+    assert client.get(f'/progress_tracking/{progress_id}').json['measurements'] == {
+        "waist": {"value": 80.5, "unit": None},
+        "chest": {"value": 90.0, "unit": None}
+    }
+
+def test_api_rejects_partly_readable_text(app2):
+    with app2.app.app_context():
+        progress = app2.ProgressTracking(user_id=8, weight=70, date=datetime.date(2024, 1, 1))
+        app2.db.session.add(progress)
+        app2.db.session.commit()
+        progress_id = progress.id
+
+    client = app2.app.test_client()
+    response = client.patch(f'/progress_tracking/{progress_id}', json={"measurements": "Waist: 80 cm; arm 30"})
+    assert response.status_code == 400
+    response = client.post('/progress_tracking', json={"user_id": 8, "weight": 70, "date": "2024-01-02",
+                                                      "measurements": {"waist": float('inf')}})
+    assert response.status_code == 400
+
+def run_migration(tmp_path, rows, encryption_key):
+    """Run the 5c1e7a2d9b40 upgrade on a database holding the given
+    (id, measurements) progress rows and return its connection."""
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "migrate.db"}')
+    conn = engine.connect()
+    conn.execute(sa.text('CREATE TABLE user (id INTEGER PRIMARY KEY)'))
+    conn.execute(sa.text('CREATE TABLE progress_tracking (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+                         'weight FLOAT NOT NULL, measurements TEXT, date DATE NOT NULL)'))
+    conn.execute(sa.text("INSERT INTO user (id) VALUES (1)"))
+    for progress_id, text in rows:
+        conn.execute(sa.text("INSERT INTO progress_tracking VALUES (:id, 1, 70, :text, '2024-01-01')"),
+                     {"id": progress_id, "text": text})
+    conn.commit()
+
+    spec = importlib.util.spec_from_file_location('structured_measurements', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    os.environ['ENCRYPTION_KEY'] = encryption_key
+    context = MigrationContext.configure(conn)
+    with Operations.context(context):
+        migration.upgrade()
+    conn.commit()
+    return conn
+
+def test_migration_refuses_partly_readable_text(tmp_path):
+    rows = [(1, 'Chest: 90 cm, Waist: 80 cm'), (2, 'Waist: 80 cm; arm 30'), (3, 'Waist: 80,5 cm')]
+    with pytest.raises(RuntimeError, match=r'ids \[2, 3\]'):
+        run_migration(tmp_path, rows, Fernet.generate_key().decode())
+
+def test_migration_encrypts_values(tmp_path):
+    key = Fernet.generate_key().decode()
+    cipher = Fernet(key.encode())
+    rows = [(1, 'Chest: 90 cm, Waist: 80 cm'), (2, cipher.encrypt(b'Hip: 95.5 cm').decode())]
+    conn = run_migration(tmp_path, rows, key)
+
+    migrated = conn.execute(sa.text('SELECT progress_id, metric, value, unit FROM progress_measurement '
+                                    'ORDER BY progress_id, metric')).fetchall()
+    assert [(p, m, float(cipher.decrypt(v.encode())), u) for p, m, v, u in migrated] == [
+        (1, 'chest', 90.0, 'cm'), (1, 'waist', 80.0, 'cm'), (2, 'hip', 95.5, 'cm')
+    ]
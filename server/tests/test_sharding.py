@@ -0,0 +1,97 @@
+import datetime
+import sqlite3
+
+import pytest
+from cryptography.fernet import Fernet
+
+from conftest import load_app2
+
+@pytest.fixture(scope='module')
+def sharded(tmp_path_factory):
+    """app2 configured with two SQLite shard files, seeded with two progress
+    rows for each of users 1-4."""
+    tmp = tmp_path_factory.mktemp('shards')
+    shard_files = [tmp / 'shard0.db', tmp / 'shard1.db']
+    app2 = load_app2(
+        DATABASE_URI=f'sqlite:///{tmp / "app.db"}',
+        SHARD_DATABASE_URIS=','.join(f'sqlite:///{path}' for path in shard_files),
+        ENCRYPTION_KEY=Fernet.generate_key().decode()
+    )
+
+    with app2.app.app_context():
+        app2.shard_router.create_all()
+        for user_id in (1, 2, 3, 4):
+            for day in (1, 2):
+                app2.route_to_user(user_id)
+                progress = app2.ProgressTracking(user_id=user_id, weight=70 + day, date=datetime.date(2024, 1, day))
+                app2.set_measurements(progress, {"waist": user_id * 10 + day})
+                app2.db.session.add(progress)
+                app2.db.session.commit()
+
+    return app2, shard_files
+
+def test_rows_are_routed_by_user_id(sharded):
+    _, shard_files = sharded
+    users_per_shard = [
+        sorted({row[0] for row in sqlite3.connect(path).execute('SELECT user_id FROM progress_tracking')})
+        for path in shard_files
+    ]
+    assert users_per_shard == [[2, 4], [1, 3]]
+
+def test_lookup_is_scoped_to_user(sharded):
+    app2, _ = sharded
+    client = app2.app.test_client()
+
+    # Both shards hold a row with id 1: user 2's on shard0 and user 1's on shard1.
+    assert client.get('/progress_tracking/1?user_id=2').json['user_id'] == 2
+    assert client.get('/progress_tracking/1?user_id=1').json['user_id'] == 1
+    # User 4 shares shard0 with user 2 but does not own row 1.
+    assert client.get('/progress_tracking/1?user_id=4').status_code == 404
+    assert client.get('/progress_tracking/1').status_code == 400
+    assert client.get('/users/3/progress/waist').json == [
+        {"value": 31.0, "unit": None, "date": "2024-01-01"},
+        {"value": 32.0, "unit": None, "date": "2024-01-02"}
+    ]
+
+def test_keyset_pages_merge_across_shards(sharded):
+    app2, _ = sharded
+    client = app2.app.test_client()
+
+    everything = [(row['user_id'], row['id']) for row in client.get('/progress_tracking').json]
+    assert everything == sorted(everything)
+    assert len(everything) == 8
+
+    pages = []
+    query = '/progress_tracking?limit=3'
+    while True:
+        page = client.get(query).json
+        if not page:
+            break
+        pages.append([(row['user_id'], row['id']) for row in page])
+        last = page[-1]
+        query = f"/progress_tracking?limit=3&after_user_id={last['user_id']}&after_id={last['id']}"
+
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [key for page in pages for key in page] == everything
+
+def test_limit_is_validated(sharded):
+    app2, _ = sharded
+    client = app2.app.test_client()
+
+    assert client.get('/progress_tracking?limit=0').json == []
+    assert client.get('/progress_tracking?limit=-1').status_code == 400
+    assert client.get('/progress_tracking?limit=ten').status_code == 400
+
+@pytest.mark.parametrize('cursor', ['after_user_id=2', 'after_id=1', 'after_user_id=2&after_id=x'])
+def test_partial_cursor_is_rejected(sharded, cursor):
+    app2, _ = sharded
+    response = app2.app.test_client().get(f'/progress_tracking?{cursor}')
+    assert response.status_code == 400
+    assert response.json == {"error": "after_user_id and after_id must be given together as integers"}
+
+def test_invalid_user_id_is_rejected_before_writing(sharded):
+    app2, _ = sharded
+    client = app2.app.test_client()
+
+    response = client.post('/progress_tracking', json={"user_id": None, "weight": 70, "date": "2024-01-03"})
+    assert response.status_code == 400
@@ -0,0 +1,103 @@
+import datetime
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from conftest import load_app2
+from write_behind import ACK_ON_ENQUEUE, ACK_ON_FLUSH
+
+@pytest.fixture(scope='module')
+def app2(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp('write_behind') / 'app.db'
+    app2 = load_app2(
+        DATABASE_URI=f'sqlite:///{db_path}',
+        ENCRYPTION_KEY=Fernet.generate_key().decode(),
+        PROGRESS_WRITE_BEHIND=ACK_ON_FLUSH,
+        PROGRESS_WRITE_BATCH_SIZE='100',
+        PROGRESS_WRITE_FLUSH_MS='200'
+    )
+    with app2.app.app_context():
+        app2.db.create_all()
+    return app2
+
+def progress_count(app2, user_id):
+    with app2.app.app_context():
+        return app2.ProgressTracking.query.filter_by(user_id=user_id).count()
+
+def test_failing_row_does_not_spoil_its_batch(app2):
+    writer = app2.progress_writer
+    start = threading.Barrier(50)
+    results = {}
+
+    def write(i):
+        progress = app2.ProgressTracking(user_id=100, weight=None if i == 25 else 70.0 + i,
+                                         date=datetime.date(2024, 1, 1))
+        app2.set_measurements(progress, {"waist": i})
+        start.wait()
+        try:
+            pending = writer.submit(progress)
+            results[i] = (pending.result, progress.to_dict())
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(results.pop(25), Exception)
+    for i, (result, row) in results.items():
+        assert result == row
+        assert result["id"] is not None
+        assert result["weight"] == 70.0 + i
+        assert result["measurements"] == {"waist": {"value": float(i), "unit": None}}
+    assert progress_count(app2, 100) == 49
+    assert writer.metrics()["failed_rows"] >= 1
+
+def test_flush_mode_returns_saved_row(app2):
+    client = app2.app.test_client()
+
+    response = client.post('/progress_tracking', json={"user_id": 200, "weight": 70.5, "date": "2024-01-03",
+                                                       "measurements": {"waist": 80}})
+    assert response.status_code == 201
+    assert response.json["id"] is not None
+    assert response.json["date"] == "2024-01-03"
+    assert response.json["measurements"] == {"waist": {"value": 80.0, "unit": None}}
+
+@pytest.mark.parametrize('body', [
+    {"user_id": 200, "weight": 70, "date": "03/01/2024"},
+    {"user_id": 200, "weight": 70},
+    {"user_id": 200, "date": "2024-01-03"},
+    {"user_id": 200, "weight": "heavy", "date": "2024-01-03"},
+    {"user_id": 200, "weight": float('nan'), "date": "2024-01-03"},
+])
+def test_invalid_rows_are_rejected_before_queueing(app2, body):
+    depth = app2.progress_writer.metrics()["flushed_rows"]
+    assert app2.app.test_client().post('/progress_tracking', json=body).status_code == 400
+    assert app2.progress_writer.metrics()["flushed_rows"] == depth
+
+def test_enqueue_mode_acknowledges_only_writable_rows(app2):
+    writer = app2.progress_writer
+    client = app2.app.test_client()
+    writer.durability = ACK_ON_ENQUEUE
+    try:
+        bad = client.post('/progress_tracking', json={"user_id": 300, "weight": 70, "date": "2024-13-01"})
+        assert bad.status_code == 400
+        good = client.post('/progress_tracking', json={"user_id": 300, "weight": 70, "date": "2024-01-03"})
+        assert good.status_code == 202
+    finally:
+        writer.durability = ACK_ON_FLUSH
+
+    deadline = time.monotonic() + 5
+    while progress_count(app2, 300) < 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert progress_count(app2, 300) == 1
+
+def test_metrics_endpoint(app2):
+    metrics = app2.app.test_client().get('/metrics/progress_writes').json
+    assert metrics["queue_capacity"] == 1000
+    assert metrics["durability"] == ACK_ON_FLUSH
+    assert metrics["flushes"] >= 1
@@ -0,0 +1,194 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+ACK_ON_ENQUEUE = 'enqueue'
+ACK_ON_FLUSH = 'flush'
+
+class PendingWrite:
+    def __init__(self, obj):
+        self.obj = obj
+        self.error = None
+        self.committed = False
+        self.result = None
+        self.done = threading.Event()
+
+class WriteBehindQueue:
+    """Bounded in-process queue that a background thread drains into the
+    database, committing up to batch_size rows per transaction and at most
+    flush_interval_ms after the first row of a batch arrived.
+
+    With durability='flush' submit() blocks until the row is committed, for
+    at most ack_timeout_ms; with durability='enqueue' it returns as soon as
+    the row is queued and rows still queued are lost if the process dies.
+    """
+
+    def __init__(self, app, db, max_size=1000, batch_size=100, flush_interval_ms=50, durability=ACK_ON_FLUSH,
+                 engine_for=None, ack_timeout_ms=5000, serialize=None):
+        if durability not in (ACK_ON_ENQUEUE, ACK_ON_FLUSH):
+            raise ValueError(f"Unknown durability mode '{durability}'")
+        self.app = app
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.durability = durability
+        self.ack_timeout = ack_timeout_ms / 1000
+        # Picks the engine a row is written to, e.g. its shard; defaults to db.engine.
+        self.engine_for = engine_for or (lambda obj: self.db.engine)
+        # Builds PendingWrite.result from a committed row while its session is still open.
+        self.serialize = serialize
+        self.queue = queue.Queue(maxsize=max_size)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "flushes": 0,
+            "flushed_rows": 0,
+            "failed_rows": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": None,
+            "total_flush_ms": 0.0
+        }
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, obj, timeout=1.0):
+        """Queue obj for insertion. Raises queue.Full when the queue stays
+        full for timeout seconds. In flush mode re-raises the commit error,
+        and raises TimeoutError when the row is not flushed within the ack
+        timeout; the row may still be committed later."""
+        pending = PendingWrite(obj)
+        self.queue.put(pending, timeout=timeout)
+        if self.durability == ACK_ON_FLUSH:
+            if not pending.done.wait(self.ack_timeout):
+                raise TimeoutError("Queued write was not flushed in time")
+            if pending.error:
+                raise pending.error
+        return pending
+
+    def stop(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats.pop("total_flush_ms")
+        stats["queue_depth"] = self.queue.qsize()
+        stats["queue_capacity"] = self.queue.maxsize
+        stats["avg_flush_ms"] = total / stats["flushes"] if stats["flushes"] else None
+        stats["durability"] = self.durability
+        return stats
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            # Never let one bad batch stop the writer: later submits would wait forever.
+            try:
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if pending is None:
+                        stopping = True
+                        break
+                    batch.append(pending)
+
+                self._flush(batch)
+            except Exception as e:
+                logger.exception("Write-behind writer failed on a batch of %d rows", len(batch))
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = pending.error or e
+                        pending.done.set()
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                by_engine = {}
+                for pending in batch:
+                    try:
+                        engine = self.engine_for(pending.obj)
+                    except Exception as e:
+                        pending.error = e
+                        logger.warning("Dropped queued write: %s", e)
+                        continue
+                    by_engine.setdefault(engine, []).append(pending)
+
+                for engine, group in by_engine.items():
+                    # expire_on_commit=False keeps the committed rows readable (ids
+                    # included) after the session is closed, so callers can serialise them.
+                    with Session(engine, expire_on_commit=False) as session:
+                        try:
+                            session.add_all([pending.obj for pending in group])
+                            session.commit()
+                            for pending in group:
+                                self._committed(pending)
+                        except Exception:
+                            session.rollback()
+                            logger.warning("Batched write of %d rows failed, retrying one by one", len(group))
+                            self._flush_each(session, group)
+        except Exception as e:
+            logger.exception("Flushing %d queued writes failed", len(batch))
+            for pending in batch:
+                if not pending.committed and pending.error is None:
+                    pending.error = e
+        finally:
+            try:
+                self._record_flush(batch, started)
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _record_flush(self, batch, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        failed = sum(1 for pending in batch if not pending.committed)
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(batch) - failed
+            self._stats["failed_rows"] += failed
+            self._stats["last_flush_ms"] = elapsed
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"] or 0.0, elapsed)
+            self._stats["total_flush_ms"] += elapsed
+
+    def _committed(self, pending):
+        pending.committed = True
+        if self.serialize:
+            try:
+                pending.result = self.serialize(pending.obj)
+            except Exception:
+                logger.exception("Could not serialise a committed write")
+
+    def _flush_each(self, session, batch):
+        for pending in batch:
+            try:
+                session.add(pending.obj)
+                session.commit()
+                self._committed(pending)
+                # A later rollback would expire this row; detach it while it is still loaded.
+                session.expunge(pending.obj)
+            except Exception as e:
+                session.rollback()
+                if pending.obj in session:
+                    session.expunge(pending.obj)
+                pending.error = e
+                logger.warning("Dropped queued write: %s", e)